@@ -1,9 +1,23 @@
 import enum
-import bitstring
+import operator
+import struct
+from typing import Any, Iterable, List, Tuple  # noqa F401
+
 import siphash
 
+try:
+    from itertools import zip_longest
+except ImportError:  # Python 2
+    from itertools import izip_longest as zip_longest
+
 from nexus_keycode.protocols.utils import full_obscure
 
+try:
+    # Optional C implementation of SipHash-2-4; much faster on short inputs
+    from csiphash import siphash24 as _csiphash24
+except ImportError:
+    _csiphash24 = None
+
 NEXUS_MODULE_VERSION_STRING = "1.0.0"
 
 """
@@ -27,35 +41,124 @@ https://github.com/angaza/nexus-embedded
 For info on Nexus Channel: https://nexus.angaza.com/channel.html
 """
 
+_UINT64_LE = struct.Struct("<Q")
+
+# Little-endian MAC input layouts, matching the packed structs in firmware.
+# `pack` into a fresh (at most 11 byte) string is cheaper than `pack_into` a
+# reused buffer, as SipHash backends would need a `bytes` copy of the latter.
+# uint32 controller_command_count, uint8 type code, uint32 command value
+_GENERIC_CONTROLLER_ACTION_INPUTS = struct.Struct("<IBI")
+# uint32 controller_command_count, uint8 type code, uint16 authority ID,
+# uint32 device ID
+_SPECIFIC_ACCESSORY_INPUTS = struct.Struct("<IBHI")
+# uint32 accessory_command_count
+_CHALLENGE_INPUTS = struct.Struct("<I")
+# uint32 controller_command_count, uint8 type code, uint32 challenge digits
+_CHALLENGE_AUTH_INPUTS = struct.Struct("<IBI")
+
+# Number of "Challenge Result" digits in a LINK_ACCESSORY_MODE_3 body
+_CHALLENGE_DIGITS = 6
+
+# 2-digit "Origin Controller Command" body for each value 0-99
+_CONTROLLER_COMMAND_DIGITS = tuple("%02d" % value for value in range(100))
+
+
+def _csiphash_siphash24(key, msg):
+    # type: (bytes, bytes) -> int
+    """SipHash-2-4 of `msg` under 16-byte `key`, as an unsigned integer.
+
+    Uses the `csiphash` C extension, which only accepts `bytes` and returns
+    the 8-byte little-endian digest.
+    """
+    return _UINT64_LE.unpack(_csiphash24(bytes(key), bytes(msg)))[0]
+
+
+def _pure_siphash24(key, msg):
+    # type: (bytes, bytes) -> int
+    """SipHash-2-4 of `msg` under 16-byte `key`, as an unsigned integer.
+
+    Uses the pure-Python `siphash` package.
+    """
+    return siphash.SipHash_2_4(key, msg).hash()
+
+
+# Origin command MACs must be SipHash-2-4: receiving controllers recompute
+# them with SipHash-2-4 in `nexus-embedded`, so a reduced-round variant
+# (e.g. SipHash-1-3) would produce tokens that devices reject.
+_siphash24 = _csiphash_siphash24 if _csiphash24 is not None else _pure_siphash24
+
+
+def _pack_mac_inputs(layout, *fields):
+    # type: (struct.Struct, *int) -> bytes
+    """Pack MAC input `fields` using `layout`.
+
+    :raises ValueError: if any field is not an integer, or is out of range
+        for its packed width
+    """
+    try:
+        return layout.pack(*fields)
+    except struct.error as e:
+        for field in fields:
+            try:
+                operator.index(field)
+            except TypeError:
+                raise ValueError(
+                    "MAC input must be an integer, not {!r}".format(field)
+                )
+        raise ValueError("MAC input out of range: {}".format(e))
+
+
+def _batch_inputs(*iterables):
+    """Zip equal-length iterables of per-token inputs for `*_batch` helpers.
+
+    :raises ValueError: if the iterables are not all the same length
+    """
+    missing = object()
+    for entry in zip_longest(*iterables, fillvalue=missing):
+        if any(value is missing for value in entry):
+            raise ValueError("Batch inputs must all be the same length.")
+        yield entry
+
+
+def _batch_int(value):
+    # type: (Any) -> int
+    """Coerce a batch integer entry (int, NumPy integer scalar) to `int`.
+
+    Unlike `int()`, rejects floats and strings rather than truncating or
+    parsing them.
+
+    :raises ValueError: if `value` is not an integer
+    """
+    try:
+        return operator.index(value)
+    except TypeError:
+        raise ValueError("Batch input must be an integer, not {!r}".format(value))
+
+
+def _batch_key(key):
+    # type: (Any) -> bytes
+    """Coerce a batch key entry (bytes, bytearray, NumPy uint8 row) to bytes."""
+    return bytes(bytearray(key))
+
 
 @enum.unique
-class ChannelOriginAction(enum.Enum):
-    """Business logic list of possible origin command actions."""
+class ChannelOriginAction(enum.IntEnum):
+    """Business logic list of possible origin command actions.
+
+    Values are arbitrary, and index into the table of constructors used by
+    `build`; they are not transmitted.
+    """
     # Delete all accessory links from a controller
-    UNLINK_ALL_ACCESSORIES = object()
+    UNLINK_ALL_ACCESSORIES = 0
     # Delete link to one specific accessory (UNSUPPORTED)
-    UNLINK_ACCESSORY = object()
+    UNLINK_ACCESSORY = 1
     # Create Nexus Channel secured link between controller and accessory
-    LINK_ACCESSORY_MODE_3 = object()
+    LINK_ACCESSORY_MODE_3 = 2
 
     def build(self, **kwargs):
         # type: () -> ChannelOriginCommandToken
         """Construct an instance of this message type."""
-
-        cls = type(self)
-        constructors = {
-            cls.UNLINK_ALL_ACCESSORIES: (
-                GenericControllerActionToken.unlink_all_accessories
-            ),
-            cls.UNLINK_ACCESSORY: (
-                SpecificLinkedAccessoryToken.unlink_specific_accessory
-            ),
-            cls.LINK_ACCESSORY_MODE_3: (
-                LinkCommandToken.challenge_mode_3
-            ),
-        }
-
-        return constructors[self](**kwargs)
+        return _ACTION_CONSTRUCTORS[self](**kwargs)
 
 
 @enum.unique
@@ -103,6 +206,9 @@ class ChannelOriginCommandToken(object):
     :see: :class:`LinkCommand`
     """
 
+    # (unobscured digits, obscured digits) from the last obscured `to_digits`
+    _obscured_digits_cache = (None, None)
+
     def __init__(self, type_, body, auth, controller_command_count):
         """
         :param type_: Type of origin command this token represents
@@ -127,42 +233,61 @@ class ChannelOriginCommandToken(object):
         return self.to_digits()
 
     def __repr__(self):
-        return (
-            "{}.{}("
-            "{type_code!r}, "
-            "{controller_command_count!r}, "
-            "{body!r}, "
-            "{auth!r},))").format(
+        return "%s.%s(%r, %r, %r, %r,))" % (
             self.__class__.__module__,
             self.__class__.__name__,
-            **self.__dict__)
+            self.type_code,
+            self.controller_command_count,
+            self.body,
+            self.auth)
 
     def to_digits(self, obscured=True):
         # type: (bool) -> str
         # String of digits making up this Nexus Channel "Token".
 
-        result = "{}{}{}".format(
-            self.type_code,
-            self.body,
-            self.auth
-        )
+        # `body` and `auth` are already strings of digits
+        result = str(self.type_code) + self.body + self.auth
         if obscured:
+            # obscuring is comparatively expensive; reuse the previous result
+            # unless the token's digits have since changed
+            unobscured, obscured_result = self._obscured_digits_cache
+            if unobscured == result:
+                return obscured_result
+
             # obscure all digits except MAC/auth
-            obscured_digit_count = len(result) - len(str(self.auth))
-            result = full_obscure(result, obscured_digit_count=obscured_digit_count)
+            obscured_digit_count = len(result) - len(self.auth)
+            obscured_result = full_obscure(
+                result, obscured_digit_count=obscured_digit_count
+            )
+            self._obscured_digits_cache = (result, obscured_result)
+            result = obscured_result
 
         return result
 
     @staticmethod
-    def digits_from_siphash(siphash_function, digits=6):
-        """ Return the least-significant digits from a Siphash function.
+    def digits_from_siphash(siphash_value, digits=6):
+        """ Return the least-significant digits from a Siphash output value.
 
         Defaults to 6, may be increased.
+
+        :param siphash_value: 64-bit integer output of SipHash-2-4
+        :type siphash_value: :class:`int`
+        """
+        return ChannelOriginCommandToken._value_and_digits_from_siphash(
+            siphash_value, digits
+        )[1]
+
+    @staticmethod
+    def _value_and_digits_from_siphash(siphash_value, digits=6):
+        # type: (int, int) -> Tuple[int, str]
+        """ Return the least-significant digits from a Siphash output value,
+        both as an integer and as a zero-padded string of `digits` digits.
+
+        :see: :meth:`digits_from_siphash`
         """
-        format_str = "{{:0{}d}}".format(digits)
-        return format_str.format(
-            siphash_function.hash() & 0xffffffff
-        )[-digits:]
+        # lower 32 bits, reduced to `digits` decimal digits
+        value = (siphash_value & 0xffffffff) % 10 ** digits
+        return value, "%0*d" % (digits, value)
 
 
 class GenericControllerActionToken(ChannelOriginCommandToken):
@@ -218,26 +343,23 @@ class GenericControllerActionToken(ChannelOriginCommandToken):
         assert len(controller_sym_key) == 16
 
         controller_command_value = type_.value
+        # transmitted as a 2-digit body
+        if not 0 <= controller_command_value <= 99:
+            raise ValueError("Controller command value must be 0-99.")
 
-        packed_target_inputs = bitstring.pack(
-            [
-                "uintle:32=controller_command_count",
-                "uintle:8=origin_command_type_code",  # '0'
-                "uintle:32=controller_command_value",  # packed as uint32
-            ],
-            controller_command_count=controller_command_count,
-            origin_command_type_code=cls._origin_command_type.value,
-            controller_command_value=controller_command_value,
-        ).bytes
+        packed_target_inputs = _pack_mac_inputs(
+            _GENERIC_CONTROLLER_ACTION_INPUTS,
+            controller_command_count,
+            cls._origin_command_type.value,  # '0'
+            controller_command_value,  # packed as uint32
+        )
         assert len(packed_target_inputs) == 9
 
-        auth = siphash.SipHash_2_4(
-            controller_sym_key,
-            packed_target_inputs)
+        auth = _siphash24(controller_sym_key, packed_target_inputs)
 
         return cls(
             type_=type_,
-            controller_command="{:02d}".format(controller_command_value),
+            controller_command=_CONTROLLER_COMMAND_DIGITS[controller_command_value],
             auth=auth,
             controller_command_count=controller_command_count
         )
@@ -254,6 +376,35 @@ class GenericControllerActionToken(ChannelOriginCommandToken):
             controller_sym_key,
         )
 
+    @classmethod
+    def unlink_all_accessories_batch(
+        cls,
+        controller_command_counts,
+        controller_sym_keys
+    ):
+        # type: (Iterable[int], Iterable[bytes]) -> List[ChannelOriginCommandToken]
+        """ Convenience helper calling `unlink_all_accessories` per controller.
+
+        Inputs are parallel iterables, one entry per controller; the
+        resulting tokens are returned in the same order. This is equivalent
+        to (and no faster than) calling `unlink_all_accessories` in a loop.
+
+        Counts may be any integers (including NumPy integer scalars, but not
+        floats), and keys any 16-byte buffers, so NumPy integer arrays (e.g.
+        a uint32 array of counts, a (N, 16) uint8 array of keys) may be
+        passed directly.
+        """
+        return [
+            cls.unlink_all_accessories(
+                _batch_int(controller_command_count),
+                _batch_key(controller_sym_key)
+            )
+            for controller_command_count, controller_sym_key in _batch_inputs(
+                controller_command_counts,
+                controller_sym_keys,
+            )
+        ]
+
 
 class SpecificLinkedAccessoryToken(ChannelOriginCommandToken):
     def __init__(
@@ -264,8 +415,7 @@ class SpecificLinkedAccessoryToken(ChannelOriginCommandToken):
             controller_command_count,
     ):
         # Truncated Nexus ID = least significant one decimal digits
-        truncated_accessory_nexus_id = "{:01d}".format(
-            (accessory_nexus_id & 0xFFFFFFFF) % 10)
+        truncated_accessory_nexus_id = str((accessory_nexus_id & 0xFFFFFFFF) % 10)
         super(SpecificLinkedAccessoryToken, self).__init__(
             type_=type_,
             body=truncated_accessory_nexus_id,
@@ -313,27 +463,19 @@ class SpecificLinkedAccessoryToken(ChannelOriginCommandToken):
         # to use to generate this MAC.
 
         # vendor / authority ID is upper 2 bytes of the full 'Nexus ID'
-        nexus_authority_id = (accessory_nexus_id & 0xFFFF00000000) >> 32
+        nexus_authority_id = (accessory_nexus_id >> 32) & 0xFFFF
         nexus_device_id = accessory_nexus_id & 0xFFFFFFFF
 
-        packed_target_inputs = bitstring.pack(
-            [
-                "uintle:32=controller_command_count",
-                "uintle:8=origin_command_type_code",  # '2' or '3'
-                "uintle:16=nexus_authority_id",
-                "uintle:32=nexus_device_id",
-            ],
-            controller_command_count=controller_command_count,
-            origin_command_type_code=type_.value,
-            nexus_authority_id=nexus_authority_id,
-            nexus_device_id=nexus_device_id
-        ).bytes
+        packed_target_inputs = _pack_mac_inputs(
+            _SPECIFIC_ACCESSORY_INPUTS,
+            controller_command_count,
+            type_.value,  # '2' or '3'
+            nexus_authority_id,
+            nexus_device_id
+        )
 
         assert len(packed_target_inputs) == 11
-        auth = siphash.SipHash_2_4(
-            controller_sym_key,
-            packed_target_inputs
-        )
+        auth = _siphash24(controller_sym_key, packed_target_inputs)
 
         return cls(
             type_=type_,
@@ -356,6 +498,42 @@ class SpecificLinkedAccessoryToken(ChannelOriginCommandToken):
             controller_sym_key
         )
 
+    @classmethod
+    def unlink_specific_accessory_batch(
+            cls,
+            accessory_nexus_ids,  # type: Iterable[int]
+            controller_command_counts,  # type: Iterable[int]
+            controller_sym_keys,  # type: Iterable[bytes]
+    ):
+        # type: (...) -> List[ChannelOriginCommandToken]
+        """ Convenience helper calling `unlink_specific_accessory` per controller.
+
+        Inputs are parallel iterables, one entry per controller; the
+        resulting tokens are returned in the same order. This is equivalent
+        to (and no faster than) calling `unlink_specific_accessory` in a
+        loop.
+
+        IDs and counts may be any integers (including NumPy integer scalars,
+        but not floats), and keys any 16-byte buffers, so NumPy integer
+        arrays may be passed directly.
+        """
+        return [
+            cls.unlink_specific_accessory(
+                _batch_int(accessory_nexus_id),
+                _batch_int(controller_command_count),
+                _batch_key(controller_sym_key)
+            )
+            for (
+                accessory_nexus_id,
+                controller_command_count,
+                controller_sym_key
+            ) in _batch_inputs(
+                accessory_nexus_ids,
+                controller_command_counts,
+                controller_sym_keys,
+            )
+        ]
+
 
 class LinkCommandToken(ChannelOriginCommandToken):
 
@@ -377,16 +555,14 @@ class LinkCommandToken(ChannelOriginCommandToken):
             controller_command_count=controller_command_count)
 
     def __repr__(self):
-        return (
-            "{}.{}("
-            "{type_code!r}, "
-            "{controller_command_count!r}, "
-            "{accessory_command_count!r}, "
-            "{body!r}, "
-            "{auth!r},))").format(
+        return "%s.%s(%r, %r, %r, %r, %r,))" % (
             self.__class__.__module__,
             self.__class__.__name__,
-            **self.__dict__)
+            self.type_code,
+            self.controller_command_count,
+            self.accessory_command_count,
+            self.body,
+            self.auth)
 
     @classmethod
     def challenge_mode_3(
@@ -410,39 +586,34 @@ class LinkCommandToken(ChannelOriginCommandToken):
         assert len(controller_sym_key) == 16
 
         # this auth is the 'challenge result' which accessory will validate
-        packed_target_inputs = bitstring.pack(
-            ["uintle:32=accessory_command_count"],
-            accessory_command_count=int(accessory_command_count)
-        ).bytes
-        assert len(packed_target_inputs) == 4
-        accessory_auth = siphash.SipHash_2_4(
-            accessory_sym_key,
-            packed_target_inputs
+        packed_target_inputs = _pack_mac_inputs(
+            _CHALLENGE_INPUTS,
+            int(accessory_command_count)
         )
+        assert len(packed_target_inputs) == 4
+        accessory_auth = _siphash24(accessory_sym_key, packed_target_inputs)
 
-        # 6-digits
-        accessory_auth_digits = cls.digits_from_siphash(accessory_auth)
+        # 6-digits, and their integer value (packed into the auth inputs)
+        challenge_digits_int, accessory_auth_digits = (
+            cls._value_and_digits_from_siphash(
+                accessory_auth, digits=_CHALLENGE_DIGITS
+            )
+        )
 
         # This auth is used by the receiver of the origin command.
         # the receiver (controller) will unpack the challenge digits as
         # a message 'body', and recompute a MAC using these. Only if the
         # computed MAC is valid (matches the transmitted MAC)
         # will the challenge digits be passed onward to the accessory.
-        packed_auth_inputs = bitstring.pack(
-            [
-                "uintle:32=controller_command_count",
-                "uintle:8=command_type_code",  # '9'
-                "uintle:32=challenge_digits_int",  # challenge digits as int
-            ],
-            controller_command_count=controller_command_count,
-            command_type_code=command_type.value,
-            challenge_digits_int=int(accessory_auth_digits)
+        packed_auth_inputs = _pack_mac_inputs(
+            _CHALLENGE_AUTH_INPUTS,
+            controller_command_count,
+            command_type.value,  # '9'
+            challenge_digits_int
         )
-        assert len(packed_auth_inputs.tobytes()) == 9
+        assert len(packed_auth_inputs) == 9
 
-        auth = siphash.SipHash_2_4(
-            controller_sym_key,
-            packed_auth_inputs.bytes)
+        auth = _siphash24(controller_sym_key, packed_auth_inputs)
 
         return cls(
             type_=command_type,
@@ -451,3 +622,56 @@ class LinkCommandToken(ChannelOriginCommandToken):
             controller_command_count=controller_command_count,
             accessory_command_count=accessory_command_count,
         )
+
+    @classmethod
+    def challenge_mode_3_batch(
+            cls,
+            controller_command_counts,  # type: Iterable[int]
+            accessory_command_counts,  # type: Iterable[int]
+            accessory_sym_keys,  # type: Iterable[bytes]
+            controller_sym_keys,  # type: Iterable[bytes]
+    ):
+        # type: (...) -> List[ChannelOriginCommandToken]
+        """ Convenience helper calling `challenge_mode_3` per pair.
+
+        Inputs are parallel iterables, one entry per controller/accessory
+        pair; the resulting tokens are returned in the same order. This is
+        equivalent to (and no faster than) calling `challenge_mode_3` in a
+        loop.
+
+        Counts may be any integers (including NumPy integer scalars, but not
+        floats), and keys any 16-byte buffers, so NumPy integer arrays may be
+        passed directly.
+        """
+        return [
+            cls.challenge_mode_3(
+                _batch_int(controller_command_count),
+                _batch_int(accessory_command_count),
+                _batch_key(accessory_sym_key),
+                _batch_key(controller_sym_key)
+            )
+            for (
+                controller_command_count,
+                accessory_command_count,
+                accessory_sym_key,
+                controller_sym_key
+            ) in _batch_inputs(
+                controller_command_counts,
+                accessory_command_counts,
+                accessory_sym_keys,
+                controller_sym_keys,
+            )
+        ]
+
+
+# Constructor for each `ChannelOriginAction`, indexed by value;
+# see `ChannelOriginAction.build`
+_ACTION_CONSTRUCTORS = (
+    # UNLINK_ALL_ACCESSORIES
+    GenericControllerActionToken.unlink_all_accessories,
+    # UNLINK_ACCESSORY
+    SpecificLinkedAccessoryToken.unlink_specific_accessory,
+    # LINK_ACCESSORY_MODE_3
+    LinkCommandToken.challenge_mode_3,
+)
+assert len(_ACTION_CONSTRUCTORS) == len(ChannelOriginAction)
@@ -1,4 +1,5 @@
 import math
+import struct
 import sys
 
 import bitstring
@@ -21,6 +22,29 @@ def ints_to_bytes(ints):
         return bytes(ints)
 
 
+_UINT32_LE = struct.Struct("<I")
+_UINT64_LE = struct.Struct("<Q")
+
+# arbitrary, but affects pseudorandom output
+_PSEUDORANDOM_KEY = b"\x00" * 16
+
+
+def _pseudorandom_chunk(iteration, seed):
+    """Bytes of 64-bit chunk `iteration` of `pseudorandom_bits` for `seed`.
+
+    :param iteration: chunk index, [0, 255]
+    :type iteration: `int`
+    :param seed: byte-aligned seed
+    :type seed: `bytes`
+    :return: 8 little-endian pseudorandom bytes
+    :rtype: `bytes`
+    """
+    hash_function = siphash.SipHash_2_4(
+        _PSEUDORANDOM_KEY, int_to_bytes(iteration) + seed
+    )
+    return _UINT64_LE.pack(hash_function.hash())
+
+
 def pseudorandom_bits(seed_bits, output_len):
     """Given some bits, compute arbitrarily many new pseudorandom bits.
 
@@ -46,16 +70,11 @@ def pseudorandom_bits(seed_bits, output_len):
     pad_bits = bitstring.Bits("0b0") * (full_seed_len - seed_bits.len)
     seed = (pad_bits + seed_bits).bytes
 
-    # compute random bits
-    fixed_key = b"\x00" * 16  # arbitrary, but affects output
-
-    def chunk(iteration):
-        hash_function = siphash.SipHash_2_4(fixed_key, int_to_bytes(iteration) + seed)
-
-        return bitstring.pack("uintle:64", hash_function.hash())
-
-    iterations = int(math.ceil(output_len / 64.0) * 64)
-    output_bits = bitstring.Bits().join(chunk(i) for i in range(iterations))
+    # compute random bits; each chunk provides 64 bits
+    iterations = int(math.ceil(output_len / 64.0))
+    output_bits = bitstring.Bits(
+        bytes=b"".join(_pseudorandom_chunk(i, seed) for i in range(iterations))
+    )
 
     return output_bits[:output_len]
 
@@ -76,17 +95,16 @@ def full_obscure(digits, sign=1, obscured_digit_count=8):
     assert len(digits) == obscured_digit_count + 6
 
     # MAC digits are last 6 of perturbed, use uint32_t value as seed
-    packed_check = bitstring.pack("uintle:32", int(digits[-6:]))
+    packed_check = _UINT32_LE.pack(int(digits[-6:]))
 
     # [0, 255] values; one for each body digit
-    # 8 body digits, 8 bytes (8 bits each), so 64 bits of output required
-    pr_bits = pseudorandom_bits(packed_check, 64)
-
-    for (i, d) in enumerate(perturbed[:obscured_digit_count]):
-        # value [0, 255]
-        pr_value = pr_bits[i * 8 : (i * 8 + 8)].uint * sign
-        perturbed[i] += pr_value
-        perturbed[i] %= 10
+    # 8 body digits, 8 bytes (8 bits each), so 64 bits of output required.
+    # Equivalent to `pseudorandom_bits(packed_check, 64)`, whose 32-bit seed
+    # needs no padding and whose 64 bits come from its first chunk alone.
+    pr_values = bytearray(_pseudorandom_chunk(0, packed_check))
+
+    for i in range(obscured_digit_count):
+        perturbed[i] = (perturbed[i] + pr_values[i] * sign) % 10
 
     return "".join(map(str, perturbed))
 
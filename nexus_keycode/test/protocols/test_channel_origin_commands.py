@@ -1,8 +1,43 @@
+import enum
 from unittest import TestCase
 
+import siphash
+
 import nexus_keycode.protocols.channel_origin_commands as protocol
 
 
+class TestSiphash24(TestCase):
+    def test_siphash24__matches_reference_implementation(self):
+        key = b'\xfe' * 8 + b'\xa2' * 8
+        for msg in (b'', b'\x0f\x00\x00\x00', b'\x01' * 9, b'\xff' * 11):
+            self.assertEqual(
+                protocol._siphash24(key, msg),
+                siphash.SipHash_2_4(key, msg).hash())
+
+    def test_csiphash_siphash24__reference_digest__matches_siphash(self):
+        # SipHash-2-4 paper test vector: key 00..0f, message 00..0e, and the
+        # digest bytes as output by the reference (and `csiphash`) C code
+        key = bytes(bytearray(range(16)))
+        msg = bytes(bytearray(range(15)))
+        digest = b'\xe5\x45\xbe\x49\x61\xca\x29\xa1'
+        calls = []
+
+        def fake_csiphash24(key, msg):
+            calls.append((key, msg))
+            return digest
+
+        original = protocol._csiphash24
+        protocol._csiphash24 = fake_csiphash24
+        try:
+            # bytearray inputs are converted, as `csiphash` requires bytes
+            value = protocol._csiphash_siphash24(bytearray(key), msg)
+        finally:
+            protocol._csiphash24 = original
+
+        self.assertEqual(calls, [(key, msg)])
+        self.assertEqual(value, siphash.SipHash_2_4(key, msg).hash())
+
+
 class TestChannelOriginActions(TestCase):
 
     def setUp(self):
@@ -29,6 +64,17 @@ class TestChannelOriginActions(TestCase):
         self.assertEqual(token.body, '00')
         self.assertEqual(token.auth, '018783')
 
+    def test_unlink_accessory_builder__ok(self):
+        token = (
+            protocol.ChannelOriginAction.UNLINK_ACCESSORY.build(
+                accessory_nexus_id=0x120003827125,
+                controller_command_count=2000,
+                controller_sym_key=b'\x00' * 8 + b'\x17' * 8
+            )
+        )
+        self.assertIsInstance(token, protocol.SpecificLinkedAccessoryToken)
+        self.assertEqual(token.to_digits(), '98228427')
+
     def test_link_challenge_mode_3_builder__ok(self):
         token = (
             protocol.ChannelOriginAction.LINK_ACCESSORY_MODE_3.build(
@@ -72,6 +118,28 @@ class TestChannelOriginCommandToken(TestCase):
         # '212' obscured to '222'
         self.assertEqual('222554433', self.atoken.to_digits())
 
+    def test_to_digits__fields_changed__obscured_output_recomputed(self):
+        token = protocol.ChannelOriginCommandToken(
+            type_=protocol.OriginCommandType.UNLINK_ACCESSORY,
+            body='12',
+            auth='554433',
+            controller_command_count=45321
+        )
+        self.assertEqual(token.to_digits(), '222554433')
+
+        token.body = '3'
+        token.auth = '228427'
+        # '23' obscured to '98'
+        self.assertEqual(token.to_digits(), '98228427')
+        self.assertEqual(token.to_digits(obscured=False), '23228427')
+
+    def test_digits_from_siphash__lower_32_bits_truncated_and_padded(self):
+        digits_from_siphash = protocol.ChannelOriginCommandToken.digits_from_siphash
+        # lower 32 bits are 0xffffffff == 4294967295
+        self.assertEqual(digits_from_siphash(0xabcdef01ffffffff), '967295')
+        self.assertEqual(digits_from_siphash(0x1200000007, digits=6), '000007')
+        self.assertEqual(digits_from_siphash(0xffffffff, digits=8), '94967295')
+
     def test_init__invalid_type__raises(self):
         self.assertRaises(
             TypeError,
@@ -81,6 +149,22 @@ class TestChannelOriginCommandToken(TestCase):
             auth='554433'
         )
 
+    def test_init__non_origin_command_type__raises(self):
+        for type_ in (
+            2,
+            protocol.ChannelOriginAction.UNLINK_ACCESSORY,
+            protocol.GenericControllerActionToken.GenericControllerActionType
+            .UNLINK_ALL_ACCESSORIES,
+        ):
+            self.assertRaises(
+                TypeError,
+                protocol.ChannelOriginCommandToken,
+                type_=type_,
+                body='12',
+                auth='554433',
+                controller_command_count=45321
+            )
+
 
 class TestGenericControllerActionToken(TestCase):
     def setUp(self):
@@ -107,6 +191,94 @@ class TestGenericControllerActionToken(TestCase):
         # Origin authentication for this command
         self.assertEqual(token.auth, '018783')
 
+    def test_unlink_all_accessories__bytearray_key__ok(self):
+        token = (
+            protocol.GenericControllerActionToken.unlink_all_accessories(
+                5,
+                bytearray(16)
+            )
+        )
+        self.assertEqual(token.auth, '155864')
+
+    def test_unlink_all_accessories__count_out_of_range__raises(self):
+        for count in (-1, 2 ** 32):
+            self.assertRaises(
+                ValueError,
+                protocol.GenericControllerActionToken.unlink_all_accessories,
+                count,
+                self.controller_sym_key
+            )
+
+    def test_generic_controller_action_builder__value_out_of_range__raises(self):
+        class OutOfRangeActionType(enum.Enum):
+            NEGATIVE = -1
+            THREE_DIGITS = 100
+
+        for type_ in OutOfRangeActionType:
+            self.assertRaises(
+                ValueError,
+                protocol.GenericControllerActionToken
+                ._generic_controller_action_builder,
+                type_,
+                self.controller_command_count,
+                self.controller_sym_key
+            )
+
+    def test_unlink_all_accessories__non_integer_count__raises(self):
+        for count in (5.0, 5.9, '12'):
+            with self.assertRaises(ValueError) as context:
+                protocol.GenericControllerActionToken.unlink_all_accessories(
+                    count,
+                    self.controller_sym_key
+                )
+            self.assertIn('must be an integer', str(context.exception))
+
+    def test_unlink_all_accessories_batch__matches_single_tokens(self):
+        counts = [self.controller_command_count, 16, 500]
+        keys = [self.controller_sym_key, b'\x00' * 16, b'\x17' * 16]
+        tokens = protocol.GenericControllerActionToken.unlink_all_accessories_batch(
+            counts, keys)
+
+        self.assertEqual(tokens[0].to_digits(), '555018783')
+        self.assertEqual(
+            [token.to_digits() for token in tokens],
+            [
+                protocol.GenericControllerActionToken.unlink_all_accessories(
+                    count, key).to_digits()
+                for count, key in zip(counts, keys)
+            ])
+
+    def test_unlink_all_accessories_batch__buffer_keys__ok(self):
+        tokens = protocol.GenericControllerActionToken.unlink_all_accessories_batch(
+            (self.controller_command_count,),
+            [bytearray(self.controller_sym_key)])
+
+        self.assertEqual(tokens[0].to_digits(), '555018783')
+
+    def test_unlink_all_accessories_batch__generators__ok(self):
+        tokens = protocol.GenericControllerActionToken.unlink_all_accessories_batch(
+            (count for count in [self.controller_command_count]),
+            iter([self.controller_sym_key]))
+
+        self.assertEqual([token.to_digits() for token in tokens], ['555018783'])
+
+    def test_unlink_all_accessories_batch__non_integer_count__raises(self):
+        for count in (5.9, '12'):
+            self.assertRaises(
+                ValueError,
+                protocol.GenericControllerActionToken.unlink_all_accessories_batch,
+                [count],
+                [self.controller_sym_key]
+            )
+
+    def test_unlink_all_accessories_batch__length_mismatch__raises(self):
+        self.assertRaises(
+            ValueError,
+            protocol.GenericControllerActionToken.unlink_all_accessories_batch,
+            [1, 2],
+            [self.controller_sym_key]
+        )
+
 
 class TestSpecificLinkedAccessoryToken(TestCase):
     def setUp(self):
@@ -135,6 +307,30 @@ class TestSpecificLinkedAccessoryToken(TestCase):
         # Origin authentication for this command
         self.assertEqual(token.auth, '228427')
 
+    def test_unlink_specific_accessory__count_out_of_range__raises(self):
+        self.assertRaises(
+            ValueError,
+            protocol.SpecificLinkedAccessoryToken.unlink_specific_accessory,
+            self.accessory_nexus_id,
+            -1,
+            self.controller_sym_key,
+        )
+
+    def test_unlink_specific_accessory_batch__matches_single_tokens(self):
+        tokens = (
+            protocol.SpecificLinkedAccessoryToken.unlink_specific_accessory_batch(
+                [self.accessory_nexus_id, 0x0102948372A4],
+                [self.controller_command_count, 15],
+                [self.controller_sym_key, b'\xfe' * 8 + b'\xa2' * 8],
+            )
+        )
+
+        self.assertEqual(tokens[0].to_digits(), '98228427')
+        self.assertEqual(
+            tokens[1].to_digits(),
+            protocol.SpecificLinkedAccessoryToken.unlink_specific_accessory(
+                0x0102948372A4, 15, b'\xfe' * 8 + b'\xa2' * 8).to_digits())
+
 
 class TestLinkCommandToken(TestCase):
     def setUp(self):
@@ -184,3 +380,34 @@ class TestLinkCommandToken(TestCase):
         # Required for Angaza keycode implementation, since 'passthrough'
         # messages don't perform authentication/validation on contents.
         self.assertEqual(token.auth, '632688')
+
+    def test_challenge_mode_3_batch__matches_single_tokens(self):
+        tokens = protocol.LinkCommandToken.challenge_mode_3_batch(
+            controller_command_counts=[self.controller_command_count, 15],
+            accessory_command_counts=[self.accessory_command_count, 312],
+            accessory_sym_keys=[self.accessory_sym_key] * 2,
+            controller_sym_keys=[self.controller_sym_key] * 2)
+
+        self.assertEqual(
+            [token.to_digits() for token in tokens],
+            ['6815536632688', '4780123960006'])
+        self.assertEqual(tokens[1].accessory_command_count, 312)
+
+    def test_challenge_mode_3__count_out_of_range__raises(self):
+        self.assertRaises(
+            ValueError,
+            protocol.LinkCommandToken.challenge_mode_3,
+            controller_command_count=self.controller_command_count,
+            accessory_command_count=2 ** 32,
+            accessory_sym_key=self.accessory_sym_key,
+            controller_sym_key=self.controller_sym_key)
+
+    def test_challenge_mode_3_batch__non_integer_count__raises(self):
+        for count in (2.0, '2'):
+            self.assertRaises(
+                ValueError,
+                protocol.LinkCommandToken.challenge_mode_3_batch,
+                controller_command_counts=[self.controller_command_count],
+                accessory_command_counts=[count],
+                accessory_sym_keys=[self.accessory_sym_key],
+                controller_sym_keys=[self.controller_sym_key])
@@ -19,6 +19,11 @@ class TestModule(TestCase):
             ("0x8a91abff01", "0b000111010100001"),
             ("0x6fa", "0b0000000010111001"),
             ("0x06fa", "0b0000000010111001"),
+            (
+                "0x06fa",
+                "0b00000000101110010101100110010011000011010100110110010011"
+                "11010111011110101011111011110011001011010100",
+            ),
         ]
 
         for (seed_bin, expected_bin) in scenarios:
@@ -16,6 +16,7 @@ setuptools.setup(
     url="https://github.com/angaza/nexus-python",
     download_url="https://github.com/angaza/nexus-python/releases/download/1.5.1/nexus_keycode-1.5.1.tar.gz",
     install_requires=["bitstring>=3.0.2", "enum34==1.1.6", "siphash==0.0.1", "typing>=3.7.4"],
+    extras_require={"fast": ["csiphash>=0.0.5"]},
     test_suite="nose2.collector",
     include_package_data=True,
     classifiers=[